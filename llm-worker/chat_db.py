@@ -1,11 +1,13 @@
 from dataclasses import dataclass
 from enum import Enum
-from typing import List
-from sqlalchemy import Column, ForeignKey, Integer, String, Text, Enum as SQLAlchemyEnum
-from sqlalchemy.orm import Session
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import Column, ForeignKey, Integer, SmallInteger, String, Text, TypeDecorator, UniqueConstraint, Enum as SQLAlchemyEnum, insert
+from sqlalchemy.orm import Session, joinedload, relationship
 from sqlalchemy.ext.declarative import declarative_base
 DBBase = declarative_base()
 
+HISTORY_LIMIT = 50
+
 class MsgRole(Enum):
     ASSISTANT = "assistant"
     USER = "user"
@@ -15,6 +17,24 @@ class RecordType(Enum):
     OPENAPI_SCHEMA = "openapi_schema"
     API_HANDLER = "api_handler"
 
+# stored codes must stay stable, append new record types at the end
+_RECORD_TYPE_CODES = {
+    RecordType.FILE: 0,
+    RecordType.OPENAPI_SCHEMA: 1,
+    RecordType.API_HANDLER: 2,
+}
+_RECORD_TYPES_BY_CODE = {code: t for t, code in _RECORD_TYPE_CODES.items()}
+
+class RecordTypeCode(TypeDecorator):
+    impl = SmallInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else _RECORD_TYPE_CODES[value]
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else _RECORD_TYPES_BY_CODE[value]
+
 class Project(DBBase):
     __tablename__ = "projects"
 
@@ -25,18 +45,27 @@ class Message(DBBase):
     __tablename__ = "messages"
 
     id = Column(Integer, primary_key=True)
-    project_id = Column(Integer, ForeignKey("projects.id"))
+    project_id = Column(Integer, ForeignKey("projects.id"), index=True)
     role = Column(SQLAlchemyEnum(MsgRole))
     content = Column(Text)
 
+class Service(DBBase):
+    __tablename__ = "services"
+    __table_args__ = (UniqueConstraint("project_id", "name"),)
+
+    id = Column(Integer, primary_key=True)
+    project_id = Column(Integer, ForeignKey("projects.id"), index=True)
+    name = Column(String)
+
 class ProjectContext(DBBase):
     __tablename__ = "project_context_records"
 
     id = Column(Integer, primary_key=True)
-    project_id = Column(Integer, ForeignKey("projects.id"))
-    record_type = Column(SQLAlchemyEnum(RecordType))
-    service_name = Column(String)
+    project_id = Column(Integer, ForeignKey("projects.id"), index=True)
+    service_id = Column(Integer, ForeignKey("services.id"), index=True)
+    record_type = Column(RecordTypeCode)
     data = Column(Text)
+    service = relationship("Service")
 
 @dataclass
 class ProjectData:
@@ -59,9 +88,26 @@ class NewProjectContext:
 def get_project_list(db: Session) -> List[Project]:
     return db.query(Project).all()
 
-def get_project_data(db: Session, project_id: int) -> ProjectData:
-    messages = db.query(Message).filter(Message.project_id == project_id).all()
-    ctx = db.query(ProjectContext).filter(ProjectContext.project_id == project_id).all()
+def get_project_messages(
+    db: Session, project_id: int, limit: Optional[int], before_id: Optional[int] = None
+) -> List[Message]:
+    query = db.query(Message).filter(Message.project_id == project_id)
+    if before_id is not None:
+        query = query.filter(Message.id < before_id)
+    messages = query.order_by(Message.id.desc()).limit(limit).all()
+    messages.reverse()
+    return messages
+
+def get_project_data(db: Session, project_id: int, limit: int = HISTORY_LIMIT) -> ProjectData:
+    # both queries run in the session's single implicit transaction
+    messages = get_project_messages(db, project_id, limit)
+    ctx = (
+        db.query(ProjectContext)
+        .options(joinedload(ProjectContext.service))
+        .filter(ProjectContext.project_id == project_id)
+        .order_by(ProjectContext.id)
+        .all()
+    )
     return ProjectData(messages=messages, context=ctx)
 
 def add_project(db: Session, name: str):
@@ -70,17 +116,54 @@ def add_project(db: Session, name: str):
     db.commit()
     return new_project
 
-def add_messages(db: Session, messages: List[NewMessage]):
-    for msg in messages:
-        db_item = Message(**msg.__dict__)
-        db.add(db_item)
-    db.commit()
-
-def add_context(db: Session, records: List[NewProjectContext]):
-    for r in records:
-        db_item = ProjectContext(**r.__dict__)
-        db.add(db_item)
-    db.commit()
+def add_messages(db: Session, messages: List[NewMessage], commit: bool = True):
+    if not messages:
+        return
+    db.execute(
+        insert(Message),
+        [
+            {"project_id": m.project_id, "role": m.role, "content": m.content}
+            for m in messages
+        ],
+    )
+    if commit:
+        db.commit()
+
+def _get_service_ids(db: Session, records: List[NewProjectContext]) -> Dict[Tuple[int, str], int]:
+    keys = {(r.project_id, r.service_name) for r in records}
+    project_ids = {project_id for project_id, _ in keys}
+    existing = db.query(Service).filter(
+        Service.project_id.in_(project_ids),
+        Service.name.in_({name for _, name in keys}),
+    ).all()
+    service_ids = {(s.project_id, s.name): s.id for s in existing}
+
+    missing = [Service(project_id=p, name=n) for p, n in keys if (p, n) not in service_ids]
+    if missing:
+        db.add_all(missing)
+        db.flush()
+        for s in missing:
+            service_ids[(s.project_id, s.name)] = s.id
+    return service_ids
+
+def add_context(db: Session, records: List[NewProjectContext], commit: bool = True):
+    if not records:
+        return
+    service_ids = _get_service_ids(db, records)
+    db.execute(
+        insert(ProjectContext),
+        [
+            {
+                "project_id": r.project_id,
+                "service_id": service_ids[(r.project_id, r.service_name)],
+                "record_type": r.record_type,
+                "data": r.data,
+            }
+            for r in records
+        ],
+    )
+    if commit:
+        db.commit()
 
 def del_project(db: Session, project_id: int):
     db.query(Project).filter(Project.id == project_id).delete()
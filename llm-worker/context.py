@@ -3,10 +3,12 @@ import os
 import sys
 from typing import Any
 
-from anthropic import Anthropic
+import httpx
+from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient, Timeout
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 
 def _init_logger() -> logging.Logger:
     logger = logging.getLogger(__name__)
@@ -25,17 +27,42 @@ def _init_db():
 
 
     engine = create_engine(
-        SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+        SQLALCHEMY_DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        poolclass=QueuePool,
+        pool_size=5,
+        max_overflow=10,
     )
 
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, _connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=memory")
+        cursor.execute("PRAGMA cache_size=-64000")
+        cursor.close()
+
+    SessionLocal = sessionmaker(
+        autocommit=False, autoflush=False, expire_on_commit=False, bind=engine
+    )
     return SessionLocal
 
+def _init_http_client() -> DefaultAsyncHttpxClient:
+    return DefaultAsyncHttpxClient(
+        http2=True,
+        limits=httpx.Limits(
+            max_keepalive_connections=50, max_connections=100, keepalive_expiry=60.0
+        ),
+    )
+
 class Context:
     def __init__(self) -> None:
         self.logger = _init_logger()
-        self.anthropic_client = Anthropic(
+        self.anthropic_client = AsyncAnthropic(
             api_key=os.getenv('ANTHROPIC_API_KEY'),
+            http_client=_init_http_client(),
+            timeout=Timeout(60.0, connect=5.0),
         )
         self.db_pool = _init_db()
 
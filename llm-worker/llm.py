@@ -1,20 +1,35 @@
+import asyncio
+import functools
 import json
-import time
+import logging
+import os
+import random
+import threading
+import orjson
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List
 from anthropic import APIStatusError, APIError
 from sqlalchemy.orm import Session
 
-from .chat_db import MsgRole, NewMessage, NewProjectContext, RecordType, add_context, add_messages, get_project_data
+from .chat_db import HISTORY_LIMIT, MsgRole, NewMessage, NewProjectContext, RecordType, add_context, add_messages, get_project_data
 from .context import Context
-from .tools import execute_tool, get_tools_list
+from .tools import execute_tools_batch, get_tools_list
 
 MAINMODEL = "claude-3-5-sonnet-20240620"
 TOOLCHECKERMODEL = "claude-3-5-sonnet-20240620"
+MAX_RETRIES = 5
+WRITE_BATCH_SIZE = 32
+WRITE_BATCH_DELAY = 0.05
+MAX_CACHED_PROJECTS = int(os.getenv("MAX_CACHED_PROJECTS", "128"))
 
+_TOOL_CHOICE_AUTO = {"type": "auto"}
 
-def build_system_prompt(metadata: str):
-    # prompt is based on https://github.com/Doriandarko/claude-engineer
-    base_system_prompt = """
+_TOOLS = get_tools_list()
+
+
+# prompt is based on https://github.com/Doriandarko/claude-engineer
+base_system_prompt = """
     You are Claude, an AI assistant powered by Anthropic's Claude-3.5-Sonnet model. You are an exceptional software developer with vast knowledge across multiple programming languages, frameworks, and best practices. Your capabilities include:
 
     1. Creating project structures, including folders and files
@@ -29,6 +44,7 @@ def build_system_prompt(metadata: str):
     10. Adding client to service in Mify workspace.
     11. Regenerating Mify boilerplate.
     12. Reading information about the project from metadata.
+    13. Searching for patterns in files.
 
     Available tools and when to use them:
 
@@ -55,6 +71,9 @@ def build_system_prompt(metadata: str):
 
     9. mify_generate: Use this tool to regenerate mify boilerplate. Always call this after user updates the OpenAPI schema.
 
+    10. search_file: Use this tool to search for a regular expression in a file and get the line numbers of the matches.
+       Example: When you need to find where a function or handler is defined in a large file.
+
     Follow these steps when editing files:
     1. Use the read_file tool to examine the current contents of the file you want to edit.
     2. Use the edit_file tool to make the changes based on content returned by read_file.
@@ -107,18 +126,32 @@ def build_system_prompt(metadata: str):
     Be sure to consider the type of project (e.g., Python, JavaScript, web application) when determining the appropriate structure and files to include.
 
     Always strive to provide the most accurate, helpful, and detailed responses possible.
-    """
+"""
 
-    chain_of_thought_prompt = """
+chain_of_thought_prompt = """
     Answer the user's request using relevant tools (if they are available). Before calling a tool, do some analysis within <thinking></thinking> tags. First, think about which of the provided tools is the relevant tool to answer the user's request. Second, go through each of the required parameters of the relevant tool and determine if the user has directly provided or given enough information to infer a value. When deciding if the parameter can be inferred, carefully consider all the context to see if it supports a specific value. If all of the required parameters are present or can be reasonably inferred, close the thinking tag and proceed with the tool call. BUT, if one of the values for a required parameter is missing, DO NOT invoke the function (not even with fillers for the missing params) and instead, ask the user to provide the missing parameters. DO NOT ask for more information on optional parameters if it is not provided.
 
     Do not reflect on the quality of the returned search results in your response.
-    """
+"""
+
+_STATIC_PROMPT = base_system_prompt + "\n\n" + chain_of_thought_prompt
+
+
+@functools.lru_cache(maxsize=128)
+def build_system_prompt(metadata: str):
+    return _STATIC_PROMPT + ("\n\nMetadata: " + metadata if metadata else "")
+
 
-    prompt = base_system_prompt + "\n\n" + chain_of_thought_prompt
-    if metadata:
-        prompt += "\n\nMetadata: " + metadata
-    return prompt
+def _trim_history(msgs: List[Dict]):
+    # keeps the newest HISTORY_LIMIT messages in place; the window may then
+    # start in the middle of a tool exchange, and the API expects it to open
+    # with a plain user message
+    start = max(0, len(msgs) - HISTORY_LIMIT)
+    start = next(
+        (i for i in range(start, len(msgs)) if msgs[i]["role"] == "user" and type(msgs[i]["content"]) == str),
+        len(msgs),
+    )
+    del msgs[:start]
 
 
 class ConversationHistory:
@@ -126,39 +159,129 @@ class ConversationHistory:
 
     def __init__(self, ctx: Context) -> None:
         self.ctx = ctx
-        self.messages = {}
+        self.data = OrderedDict()
+        # get_data runs on executor threads while saves happen on the event
+        # loop, the LRU bookkeeping has to be atomic across both
+        self.lock = threading.Lock()
+        # per project count of writes handed to the writer and finished by it,
+        # flushed is notified whenever a batch completes
+        self.queued = Counter()
+        self.written = Counter()
+        self.flushed = threading.Condition(self.lock)
+        # the writer gets its own thread so it can't be starved by executor
+        # threads blocked in wait_for_writes
+        self.write_executor = ThreadPoolExecutor(max_workers=1)
+
+    def wait_for_writes(self, project_id: int) -> int:
+        # blocks until everything queued for the project so far is in the DB
+        with self.flushed:
+            queued = self.queued[project_id]
+            self.flushed.wait_for(lambda: self.written[project_id] >= queued)
+            return queued
+
+    def _load(self, db: Session, project_id: int):
+        data = get_project_data(db, project_id)
+        msgs = [orjson.loads(msg.content) for msg in data.messages]
+        _trim_history(msgs)
+        metadata = {}
+        for record in data.context:
+            service_name = record.service.name
+            if not service_name in metadata:
+                metadata[service_name] = []
+            metadata[service_name].append(
+                {"record_type": record.record_type.value, "data": record.data}
+            )
+        return {"messages": msgs, "metadata": metadata}
 
     def get_data(self, db: Session, project_id: int):
-        if not project_id in self.messages:
-            data = get_project_data(db, project_id)
-            self.data = {project_id: {"messages": [], "metadata": {}}}
-            for msg in data.messages:
-                self.data[project_id]["messages"].append(json.loads(msg.content))
-            for record in data.context:
-                if not record.service_name in self.data[project_id]["metadata"]:
-                    self.data[project_id]["metadata"][record.service_name] = []
-                self.data[project_id]["metadata"][record.service_name].append(
-                    {"record_type": record.record_type.value, "data": record.data}
-                )
-        msgs = self.data[project_id]["messages"]
-        meta = self.data[project_id]["metadata"]
-        self.ctx.logger.info(f"got {len(msgs)} in conversation history")
+        with self.lock:
+            entry = self.data.get(project_id)
+            if entry is not None:
+                self.data.move_to_end(project_id)
+        while entry is None:
+            # turns still in the write queue aren't in the DB yet, so wait for
+            # them before reloading; the load itself runs without the lock so
+            # other projects aren't blocked on the DB
+            queued = self.wait_for_writes(project_id)
+            loaded = self._load(db, project_id)
+            with self.lock:
+                entry = self.data.get(project_id)
+                if entry is None and self.queued[project_id] == queued:
+                    entry = self.data[project_id] = loaded
+                if entry is not None:
+                    self.data.move_to_end(project_id)
+                    while len(self.data) > MAX_CACHED_PROJECTS:
+                        self.data.popitem(last=False)
+                # otherwise a save slipped in while loading, load again
+        msgs = entry["messages"]
+        meta = entry["metadata"]
+        self.ctx.logger.info("got %d in conversation history", len(msgs))
         return (msgs, meta)
 
-    def save_conversation(
-        self, db: Session, project_id: int, messages: List[Dict[str, str]]
-    ):
-        out = []
+    def forget(self, project_id: int):
+        with self.lock:
+            self.data.pop(project_id, None)
 
-        self.ctx.logger.info(f"saving conversation: {len(messages)}")
-        for msg in messages:
-            role = MsgRole.USER if msg["role"] == "user" else MsgRole.ASSISTANT
-            out.append(
-                NewMessage(role=role, content=json.dumps(msg), project_id=project_id)
-            )
-        add_messages(db, out)
+    def start_writer(self):
+        self.write_queue = asyncio.Queue()
+        self.writer_task = asyncio.create_task(self._run_writer())
 
-        self.data[project_id]["messages"].extend(messages)
+    async def stop_writer(self):
+        await self.write_queue.join()
+        self.writer_task.cancel()
+
+    async def save_conversation(
+        self, project_id: int, messages: List[Dict[str, str]], metadata
+    ):
+        self.ctx.logger.info("saving conversation: %d", len(messages))
+        with self.lock:
+            entry = self.data.get(project_id)
+            if entry is not None:
+                entry["messages"].extend(messages)
+                _trim_history(entry["messages"])
+                entry["metadata"] = self.append_metadata(entry["metadata"], metadata)
+            self.queued[project_id] += 1
+        await self.write_queue.put((project_id, messages, metadata))
+
+    async def _run_writer(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.write_queue.get()]
+            while len(batch) < WRITE_BATCH_SIZE:
+                try:
+                    batch.append(await asyncio.wait_for(self.write_queue.get(), timeout=WRITE_BATCH_DELAY))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await loop.run_in_executor(self.write_executor, self._write_batch, batch)
+            except Exception:
+                self.ctx.logger.exception("failed to save %d conversation updates", len(batch))
+                # the cache already holds these turns, drop it so the next
+                # request reloads what actually made it to the DB
+                for project_id in {project_id for (project_id, _, _) in batch}:
+                    self.forget(project_id)
+            finally:
+                with self.flushed:
+                    for (project_id, _, _) in batch:
+                        self.written[project_id] += 1
+                    self.flushed.notify_all()
+                for _ in batch:
+                    self.write_queue.task_done()
+
+    def _write_batch(self, batch):
+        out_messages = []
+        out_records = []
+        for (project_id, messages, metadata) in batch:
+            for msg in messages:
+                role = MsgRole.USER if msg["role"] == "user" else MsgRole.ASSISTANT
+                out_messages.append(
+                    NewMessage(role=role, content=orjson.dumps(msg).decode(), project_id=project_id)
+                )
+            out_records.extend(self._metadata_records(project_id, metadata))
+        with self.ctx.db_pool() as db:
+            add_messages(db, out_messages, commit=False)
+            add_context(db, out_records, commit=False)
+            db.commit()
 
     def append_metadata(self, metadata, new_data):
         if new_data:
@@ -170,11 +293,11 @@ class ConversationHistory:
                 metadata[service_name].extend(records)
         return metadata
 
-    def save_metadata(self, db: Session, project_id: int, metadata):
+    def _metadata_records(self, project_id: int, metadata) -> List[NewProjectContext]:
+        out_records = []
         if not metadata:
-            return
+            return out_records
 
-        out_records = []
         for service_name, records in metadata.items():
             for r in records:
                 out_records.append(
@@ -185,23 +308,19 @@ class ConversationHistory:
                         project_id=project_id,
                     )
                 )
-        add_context(db, out_records)
+        return out_records
 
     def metadata_to_xml(self, project_id: int, metadata):
-        full_text = ""
-        project_block = f"<project name=\"{project_id}\">"
-        full_text += project_block
+        parts = [f"<metadata><project name=\"{project_id}\">"]
         for service_name, records in metadata.items():
-            full_text += f"<service name=\"{service_name}\">"
-            for r in records:
-                full_text += f"<record type=\"{r['record_type']}\">"
-                full_text += r["data"]
-                full_text += "</record>"
-            full_text += f"</service>"
-
-        project_end = "</project>"
-        full_text += project_end
-        return f"<metadata>{full_text}</metadata>"
+            parts.append(f"<service name=\"{service_name}\">")
+            parts.extend(
+                f"<record type=\"{r['record_type']}\">{r['data']}</record>"
+                for r in records
+            )
+            parts.append("</service>")
+        parts.append("</project></metadata>")
+        return "".join(parts)
 
 class LLM:
     ctx: Context
@@ -210,25 +329,48 @@ class LLM:
     def __init__(self, ctx: Context) -> None:
         self.conversation_history = []
         self.ctx = ctx
-        self.tools = get_tools_list()
-
-    def send_message(self, db: Session, project_id: int, msg: str):
-        (history, metadata) = self.ctx.deps.conversation_history.get_data(db, project_id)
+        self.tools = _TOOLS
+
+    async def _call_anthropic(self, model: str, system: str, messages: List):
+        for attempt in range(MAX_RETRIES):
+            try:
+                async with self.ctx.anthropic_client.messages.stream(
+                    model=model,
+                    max_tokens=4000,
+                    system=system,
+                    messages=messages,
+                    tools=self.tools,
+                    tool_choice=_TOOL_CHOICE_AUTO,
+                ) as stream:
+                    return await stream.get_final_message()
+            except APIStatusError as e:
+                if e.status_code != 429 or attempt == MAX_RETRIES - 1:
+                    raise
+                delay = min(60, 2**attempt) + random.random()
+                self.ctx.logger.info("error 429, retrying in %.1fs", delay)
+                await asyncio.sleep(delay)
+
+    def _load_history(self, project_id: int):
+        with self.ctx.db_pool() as db:
+            return self.ctx.deps.conversation_history.get_data(db, project_id)
+
+    async def send_message(self, project_id: int, msg: str):
+        # DB work runs in the default executor and the session is released
+        # before the model call, so a slow LLM turn doesn't pin a connection
+        loop = asyncio.get_running_loop()
+        (history, metadata) = await loop.run_in_executor(None, self._load_history, project_id)
         metadata_xml = self.ctx.deps.conversation_history.metadata_to_xml(project_id, metadata)
-        self.ctx.logger.info(f"metadata xml: {metadata_xml}")
+        self.ctx.logger.info("metadata xml: %s", metadata_xml)
 
-        current_conversation = []
-        current_conversation.append({"role": "user", "content": msg})
-        messages = history + current_conversation
+        system_prompt = build_system_prompt(metadata_xml)
+
+        messages = list(history)
+        # the cached history keeps growing while this turn awaits the model,
+        # so remember where the new turns start in our own copy
+        history_len = len(messages)
+        messages.append({"role": "user", "content": msg})
         try:
-            response = self.ctx.anthropic_client.messages.create(
-                model=MAINMODEL,
-                max_tokens=4000,
-                system=build_system_prompt(metadata_xml),
-                messages=messages,
-                tools=self.tools,
-                tool_choice={"type": "auto"},
-            )
+            response = await self._call_anthropic(MAINMODEL, system_prompt, messages)
             assistant_response = ""
             tool_uses = []
             for content_block in response.content:
@@ -237,65 +379,56 @@ class LLM:
                 elif content_block.type == "tool_use":
                     tool_uses.append(content_block)
 
-            for tool_use in tool_uses:
+            new_metadata = None
+            tool_use_blocks = []
+            tool_result_blocks = []
+            results = []
+            if tool_uses:
+                calls = [{"name": t.name, "input": t.input} for t in tool_uses]
+                try:
+                    results = await loop.run_in_executor(None, execute_tools_batch, calls)
+                except Exception as e:
+                    error_message = f"Error executing tool: {str(e)}"
+                    self.ctx.logger.info("tool error %s", error_message)
+                    results = [(error_message, None)] * len(calls)
+
+            for tool_use, (result, metadata_maybe) in zip(tool_uses, results):
                 tool_name = tool_use.name
                 tool_input = tool_use.input
                 tool_use_id = tool_use.id
 
-                self.ctx.logger.info(f"used tool {tool_name}")
-                self.ctx.logger.info(f"tool input: {json.dumps(tool_input, indent=2)}")
+                self.ctx.logger.info("used tool %s", tool_name)
+                if self.ctx.logger.isEnabledFor(logging.DEBUG):
+                    self.ctx.logger.debug("tool input: %s", json.dumps(tool_input, indent=2))
+                self.ctx.logger.info("tool result %s", result)
                 assistant_response += f"\n\n<tool>Used tool {tool_name}"
                 assistant_response += f", input: {json.dumps(tool_input, indent=2)}</tool>\n\n"
 
-                metadata_maybe = None
-                metadata = None
-                try:
-                    (result, metadata_maybe) = execute_tool(tool_name, tool_input)
-                    self.ctx.logger.info(f"tool result {result}")
-                except Exception as e:
-                    result = f"Error executing tool: {str(e)}"
-                    self.ctx.logger.info(f"tool error {result}")
-
-                current_conversation.append(
+                tool_use_blocks.append(
                     {
-                        "role": "assistant",
-                        "content": [
-                            {
-                                "type": "tool_use",
-                                "id": tool_use_id,
-                                "name": tool_name,
-                                "input": tool_input,
-                            }
-                        ],
+                        "type": "tool_use",
+                        "id": tool_use_id,
+                        "name": tool_name,
+                        "input": tool_input,
                     }
                 )
-                current_conversation.append(
+                tool_result_blocks.append(
                     {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "tool_result",
-                                "tool_use_id": tool_use_id,
-                                "content": result,
-                            }
-                        ],
+                        "type": "tool_result",
+                        "tool_use_id": tool_use_id,
+                        "content": result,
                     }
                 )
 
                 if metadata_maybe:
-                    metadata = self.ctx.deps.conversation_history.append_metadata(metadata, metadata_maybe)
-
-                messages = history + current_conversation
+                    new_metadata = self.ctx.deps.conversation_history.append_metadata(new_metadata, metadata_maybe)
 
+            if tool_uses:
+                # all tool results go back to the model in a single follow-up call
+                messages.append({"role": "assistant", "content": tool_use_blocks})
+                messages.append({"role": "user", "content": tool_result_blocks})
                 try:
-                    tool_response = self.ctx.anthropic_client.messages.create(
-                        model=TOOLCHECKERMODEL,
-                        max_tokens=4000,
-                        system=build_system_prompt(metadata_xml),
-                        messages=messages,
-                        tools=self.tools,
-                        tool_choice={"type": "auto"},
-                    )
+                    tool_response = await self._call_anthropic(TOOLCHECKERMODEL, system_prompt, messages)
 
                     tool_checker_response = ""
                     for tool_content_block in tool_response.content:
@@ -304,25 +437,17 @@ class LLM:
                     assistant_response += "\n\n" + tool_checker_response
                 except APIError as e:
                     error_message = f"Error in tool response: {str(e)}"
-                    self.ctx.logger.info(f"error {error_message}")
+                    self.ctx.logger.info("error %s", error_message)
                     assistant_response += f"\n\n{error_message}"
 
-            current_conversation.append(
+            messages.append(
                 {"role": "assistant", "content": assistant_response}
             )
-            self.ctx.deps.conversation_history.save_conversation(
-                db, project_id, current_conversation
+            await self.ctx.deps.conversation_history.save_conversation(
+                project_id, messages[history_len:], new_metadata
             )
-            self.ctx.deps.conversation_history.save_metadata(db, project_id, metadata)
 
             return {"msg": assistant_response, "raw": response}
-        except APIStatusError as e:
-            if e.status_code == 429:
-                self.ctx.logger.info(f"error 429, retrying")
-                time.sleep(5)
-                return self.send_message(db, project_id, msg)
-            else:
-                raise RuntimeError(f"API Error {str(e)}")
         except APIError as e:
-            self.ctx.logger.info(f"API Error: {str(e)}")
+            self.ctx.logger.info("API Error: %s", e)
             raise RuntimeError(f"API Error {str(e)}")
@@ -1,8 +1,9 @@
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+import orjson
 
-from .chat_db import add_project, del_project, get_project_list
+from .chat_db import add_project, del_project, get_project_list, get_project_messages
 from .dependencies import make_context
 
 app = FastAPI()
@@ -16,18 +17,40 @@ app.add_middleware(
 
 ctx = make_context()
 
+@app.on_event("startup")
+async def start_writer():
+    ctx.deps.conversation_history.start_writer()
+
+@app.on_event("shutdown")
+async def stop_writer():
+    await ctx.deps.conversation_history.stop_writer()
+
 @app.get("/api/chat/history")
-def history(project_id: int):
+def history(project_id: int, limit: Optional[int] = None, before_id: Optional[int] = None):
+    # turns from a finished /api/chat may still be in the write queue
+    ctx.deps.conversation_history.wait_for_writes(project_id)
     out_msgs = []
     with ctx.db_pool() as session:
-        (history, _metadata) = ctx.deps.conversation_history.get_data(session, project_id)
-        for msg in history:
-            if type(msg["content"]) != str:
-                continue
-            out_msgs.append({
-                "isUser": msg["role"] == "user",
-                "content": msg["content"],
-            })
+        while True:
+            rows = get_project_messages(session, project_id, limit, before_id)
+            page = []
+            for row in rows:
+                msg = orjson.loads(row.content)
+                if type(msg["content"]) != str:
+                    continue
+                page.append({
+                    "id": row.id,
+                    "isUser": msg["role"] == "user",
+                    "content": msg["content"],
+                })
+            out_msgs[:0] = page
+            # tool exchange rows are stored but not shown, so keep paging back
+            # until limit counts visible messages
+            if limit is None or len(rows) < limit or len(out_msgs) >= limit:
+                break
+            before_id = rows[0].id
+    if limit is not None and len(out_msgs) > limit:
+        out_msgs = out_msgs[-limit:]
     return out_msgs
 
 @app.get("/api/chat/projects")
@@ -50,18 +73,18 @@ def add_new_project(req: Dict[str, str]):
 def delete_project(project_id: int):
     with ctx.db_pool() as session:
         del_project(session, project_id)
+    ctx.deps.conversation_history.forget(project_id)
 
 @app.post("/api/chat")
-def chat(req: Dict[str, Any]):
+async def chat(req: Dict[str, Any]):
     message = req["message"]
     project_id = int(req["project_id"])
 
-    ctx.logger.info(f"request: {message}")
-    with ctx.db_pool() as session:
-        resp = ctx.deps.llm.send_message(session, project_id, message)
-        ctx.logger.info(f"response: {resp}")
+    ctx.logger.info("request: %s", message)
+    resp = await ctx.deps.llm.send_message(project_id, message)
+    ctx.logger.debug("response: %s", resp.get("msg"))
 
-        if "msg" in resp:
-            return {"message": resp["msg"]}
-        else:
-            return {"message": "Request failed"}
+    if "msg" in resp:
+        return {"message": resp["msg"]}
+    else:
+        return {"message": "Request failed"}
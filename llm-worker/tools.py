@@ -1,194 +1,326 @@
+import contextlib
 import difflib
-from importlib import metadata
+import functools
+import io
+import mmap
 import os
 import re
+import shutil
 import yaml
 import subprocess
-from typing import Any, Dict, Optional, Tuple
-
-
-def get_tools_list():
-    return [
-        {
-            "name": "create_folder",
-            "description": "Create a new folder at the specified path. Use this when you need to create a new directory in the project structure.",
-            "input_schema": {
-                "type": "object",
-                "properties": {
-                    "path": {
-                        "type": "string",
-                        "description": "The path where the folder should be created",
-                    }
-                },
-                "required": ["path"],
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+# bounded cache shared by every regex the tools compile, str and bytes alike
+_compile = functools.lru_cache(maxsize=256)(re.compile)
+
+
+_TOOLS_LIST = [
+    {
+        "name": "create_folder",
+        "description": "Create a new folder at the specified path. Use this when you need to create a new directory in the project structure.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "path": {
+                    "type": "string",
+                    "description": "The path where the folder should be created",
+                }
             },
+            "required": ["path"],
         },
-        {
-            "name": "create_file",
-            "description": "Create a new file at the specified path with content. Use this when you need to create a new file in the project structure.",
-            "input_schema": {
-                "type": "object",
-                "properties": {
-                    "path": {
-                        "type": "string",
-                        "description": "The path where the file should be created",
-                    },
-                    "content": {
-                        "type": "string",
-                        "description": "The content of the file",
-                    },
+    },
+    {
+        "name": "create_file",
+        "description": "Create a new file at the specified path with content. Use this when you need to create a new file in the project structure.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "path": {
+                    "type": "string",
+                    "description": "The path where the file should be created",
+                },
+                "content": {
+                    "type": "string",
+                    "description": "The content of the file",
                 },
-                "required": ["path", "content"],
             },
+            "required": ["path", "content"],
         },
-        {
-            "name": "edit_file",
-            "description": "Edit a file content. Use this tool after getting content from read_file.",
-            "input_schema": {
-                "type": "object",
-                "properties": {
-                    "path": {
-                        "type": "string",
-                        "description": "The path of the file to edit",
-                    },
-                    "new_content": {
-                        "type": "string",
-                        "description": "The new content to replace the specified lines",
-                    },
+    },
+    {
+        "name": "edit_file",
+        "description": "Edit a file content. Use this tool after getting content from read_file.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "path": {
+                    "type": "string",
+                    "description": "The path of the file to edit",
+                },
+                "new_content": {
+                    "type": "string",
+                    "description": "The new content to replace the specified lines",
                 },
-                "required": ["path", "new_content"],
             },
+            "required": ["path", "new_content"],
         },
-        {
-            "name": "read_file",
-            "description": "Read the contents of a file at the specified path. Use this when you need to examine the contents of an existing file.",
-            "input_schema": {
-                "type": "object",
-                "properties": {
-                    "path": {
-                        "type": "string",
-                        "description": "The path of the file to read",
-                    }
-                },
-                "required": ["path"],
+    },
+    {
+        "name": "read_file",
+        "description": "Read the contents of a file at the specified path. Use this when you need to examine the contents of an existing file.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "path": {
+                    "type": "string",
+                    "description": "The path of the file to read",
+                }
             },
+            "required": ["path"],
         },
-        {
-            "name": "list_files",
-            "description": "List all files and directories in the specified folder. Use this when you need to see the contents of a directory.",
-            "input_schema": {
-                "type": "object",
-                "properties": {
-                    "path": {
-                        "type": "string",
-                        "description": "The path of the folder to list (default: current directory)",
-                    }
+    },
+    {
+        "name": "search_file",
+        "description": "Search for a specific pattern in a file and return the line numbers where the pattern is found. Use this to locate code before reading or editing large files.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "path": {
+                    "type": "string",
+                    "description": "The path of the file to search",
                 },
+                "search_pattern": {
+                    "type": "string",
+                    "description": "The regular expression to search for",
+                },
+            },
+            "required": ["path", "search_pattern"],
+        },
+    },
+    {
+        "name": "list_files",
+        "description": "List all files and directories in the specified folder. Use this when you need to see the contents of a directory.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "path": {
+                    "type": "string",
+                    "description": "The path of the folder to list (default: current directory)",
+                }
             },
         },
-        {
-            "name": "create_workspace",
-            "description": "Create mify workspace",
-            "input_schema": {
-                "type": "object",
-                "properties": {
-                    "path": {
-                        "type": "string",
-                        "description": "The path of the workspace to list (default: current directory)",
-                    },
+    },
+    {
+        "name": "create_workspace",
+        "description": "Create mify workspace",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "path": {
+                    "type": "string",
+                    "description": "The path of the workspace to list (default: current directory)",
                 },
-                "required": ["path"],
             },
+            "required": ["path"],
         },
-        {
-            "name": "create_service",
-            "description": "Create mify service",
-            "input_schema": {
-                "type": "object",
-                "properties": {
-                    "path": {
-                        "type": "string",
-                        "description": "The path of the workspace to list (default: current directory)",
-                    },
-                    "name": {
-                        "type": "string",
-                        "description": "The name of the service",
-                    },
-                    "language": {
-                        "type": "string",
-                        "description": "The language of the service",
-                    },
+    },
+    {
+        "name": "create_service",
+        "description": "Create mify service",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "path": {
+                    "type": "string",
+                    "description": "The path of the workspace to list (default: current directory)",
+                },
+                "name": {
+                    "type": "string",
+                    "description": "The name of the service",
+                },
+                "language": {
+                    "type": "string",
+                    "description": "The language of the service",
                 },
-                "required": ["path", "name", "language"],
             },
+            "required": ["path", "name", "language"],
         },
-        {
-            "name": "add_client",
-            "description": "Add client to service",
-            "input_schema": {
-                "type": "object",
-                "properties": {
-                    "path": {
-                        "type": "string",
-                        "description": "The path of the workspace to list (default: current directory)",
-                    },
-                    "name": {
-                        "type": "string",
-                        "description": "The name of the service",
-                    },
-                    "client_name": {
-                        "type": "string",
-                        "description": "Name of the client service",
-                    },
+    },
+    {
+        "name": "add_client",
+        "description": "Add client to service",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "path": {
+                    "type": "string",
+                    "description": "The path of the workspace to list (default: current directory)",
+                },
+                "name": {
+                    "type": "string",
+                    "description": "The name of the service",
+                },
+                "client_name": {
+                    "type": "string",
+                    "description": "Name of the client service",
                 },
-                "required": ["path", "name", "client_name"],
             },
+            "required": ["path", "name", "client_name"],
         },
-        {
-            "name": "mify_generate",
-            "description": "Regenerate mify boilerplate",
-            "input_schema": {
-                "type": "object",
-                "properties": {
-                    "path": {
-                        "type": "string",
-                        "description": "The path of the workspace to list (default: current directory)",
-                    },
-                    "name": {
-                        "type": "string",
-                        "description": "The name of the service",
-                    },
+    },
+    {
+        "name": "mify_generate",
+        "description": "Regenerate mify boilerplate",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "path": {
+                    "type": "string",
+                    "description": "The path of the workspace to list (default: current directory)",
+                },
+                "name": {
+                    "type": "string",
+                    "description": "The name of the service",
                 },
-                "required": ["path", "name"],
             },
+            "required": ["path", "name"],
         },
-    ]
+    },
+]
+
+
+def get_tools_list():
+    return _TOOLS_LIST
+
+
+_IO_BUFFER_SIZE = 64 * 1024
+
+
+# mkstemp creates files as 0600, new files get the mode open() would give them
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def _atomic_write(path, content):
+    # readers never see a half written file if the worker dies mid write;
+    # write through symlinks so the link itself is kept
+    target = os.path.realpath(path)
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), prefix=".tmp-")
+    except OSError as e:
+        # report the requested path, the temp name means nothing to the caller
+        raise OSError(e.errno, e.strerror, path) from None
+    try:
+        with os.fdopen(fd, "w", buffering=_IO_BUFFER_SIZE) as f:
+            f.write(content)
+        if os.path.exists(target):
+            shutil.copymode(target, tmp_path)
+        else:
+            os.chmod(tmp_path, 0o666 & ~_UMASK)
+        os.replace(tmp_path, target)
+        if "\r" not in content:
+            # text mode reads would translate \r, so only cache what reads back as is
+            _remember_file(path, os.stat(path), content)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
+
+
+# files smaller than this are cheaper to read through the regular file API
+_MMAP_THRESHOLD = 64 * 1024
+
+
+def _read_mmap(path) -> Optional[str]:
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if hasattr(mm, "madvise"):
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+            mm.madvise(mmap.MADV_WILLNEED)
+        if mm.find(b"\r") != -1:
+            # let text mode handle newline translation
+            return None
+        return str(mm, "utf-8")
+
+
+_FILE_CACHE_SIZE = 32
+_file_cache: "OrderedDict[str, Tuple[int, int, str]]" = OrderedDict()
+_file_cache_lock = threading.Lock()
+
+
+def _remember_file(path, st, content):
+    with _file_cache_lock:
+        _file_cache[path] = (st.st_mtime_ns, st.st_size, content)
+        _file_cache.move_to_end(path)
+        if len(_file_cache) > _FILE_CACHE_SIZE:
+            _file_cache.popitem(last=False)
+
+
+def _load_file(path) -> str:
+    # the model reads a file right before editing it, keep recent contents
+    # around until the file changes on disk
+    st = os.stat(path)
+    with _file_cache_lock:
+        entry = _file_cache.get(path)
+    if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+        return entry[2]
+
+    content = None
+    if st.st_size >= _MMAP_THRESHOLD:
+        content = _read_mmap(path)
+    if content is None:
+        with open(path, "r", buffering=_IO_BUFFER_SIZE) as f:
+            content = f.read()
+    _remember_file(path, st, content)
+    return content
 
 
 def create_folder(path) -> Tuple[str, Optional[Dict[str, Any]]]:
     try:
         os.makedirs(path, exist_ok=True)
         return (f"Folder created: {path}", None)
-    except Exception as e:
+    except OSError as e:
         return (f"Error creating folder: {str(e)}", None)
 
 
 def create_file(path, content="") -> Tuple[str, Optional[Dict[str, Any]]]:
     try:
-        with open(path, "w") as f:
-            f.write(content)
+        _atomic_write(path, content)
         return (f"File created: {path}", None)
-    except Exception as e:
+    except OSError as e:
         return (f"Error creating file: {str(e)}", None)
 
 
+def _strip_common_lines(old_lines, new_lines):
+    # unchanged head and tail don't affect the added/removed counts, so only
+    # the edited region needs to go through the diff
+    start = 0
+    limit = min(len(old_lines), len(new_lines))
+    while start < limit and old_lines[start] == new_lines[start]:
+        start += 1
+    end = 0
+    while end < limit - start and old_lines[-1 - end] == new_lines[-1 - end]:
+        end += 1
+    return (
+        old_lines[start:len(old_lines) - end],
+        new_lines[start:len(new_lines) - end],
+    )
+
+
 def generate_and_apply_diff(
     original_content, new_content, path
 ) -> Tuple[str, Optional[Dict[str, Any]]]:
+    old_lines, new_lines = _strip_common_lines(
+        original_content.splitlines(keepends=True),
+        new_content.splitlines(keepends=True),
+    )
     diff = list(
         difflib.unified_diff(
-            original_content.splitlines(keepends=True),
-            new_content.splitlines(keepends=True),
+            old_lines,
+            new_lines,
             fromfile=f"a/{path}",
             tofile=f"b/{path}",
             n=3,
@@ -199,15 +331,14 @@ def generate_and_apply_diff(
         return ("No changes detected.", None)
 
     try:
-        with open(path, "w") as f:
-            f.writelines(new_content)
+        _atomic_write(path, new_content)
 
-        added_lines = sum(
-            1 for line in diff if line.startswith("+") and not line.startswith("+++")
-        )
-        removed_lines = sum(
-            1 for line in diff if line.startswith("-") and not line.startswith("---")
-        )
+        added_lines = removed_lines = 0
+        for line in diff:
+            if line[:1] == "+" and line[:3] != "+++":
+                added_lines += 1
+            elif line[:1] == "-" and line[:3] != "---":
+                removed_lines += 1
 
         summary = f"Changes applied to {path}:\n"
         summary += f"  Lines added: {added_lines}\n"
@@ -215,7 +346,7 @@ def generate_and_apply_diff(
 
         return (summary, None)
 
-    except Exception as e:
+    except OSError as e:
         print(f"Error: {str(e)}")
         return (f"Error applying changes: {str(e)}", None)
 
@@ -224,46 +355,108 @@ def edit_file(
     path, new_content
 ) -> Tuple[str, Optional[Dict[str, Any]]]:
     try:
-        with open(path, "r") as file:
-            content = file.readlines()
-        original_content = "".join(content)
+        original_content = _load_file(path)
 
         if new_content != original_content:
-            diff_result = generate_and_apply_diff(original_content, new_content, path)
+            (diff_result, _) = generate_and_apply_diff(original_content, new_content, path)
             return (
                 f"Successfully edited file in {path}\n{diff_result}",
                 None,
             )
         return (f"File {path} is not changed, skipping update", None)
-    except Exception as e:
+    except (OSError, ValueError) as e:
         return (f"Error editing file: {str(e)}", None)
 
 
 def read_file(path) -> Tuple[str, Optional[Dict[str, Any]]]:
     try:
-        with open(path, "r") as f:
-            content = f.read()
-        return (content, None)
-    except Exception as e:
+        return (_load_file(path), None)
+    except (OSError, ValueError) as e:
         return (f"Error reading file: {str(e)}", None)
 
 
+_REGEX_METACHARS = _compile(r"[.^$*+?{}\[\]\\|()]")
+
+
+def _is_literal(search_pattern):
+    # text mode turns \r into \n, so patterns with either go through the line scan
+    return (
+        "\n" not in search_pattern
+        and "\r" not in search_pattern
+        and _REGEX_METACHARS.search(search_pattern) is None
+    )
+
+
+def _search_literal(content, search_pattern):
+    # content comes from _load_file, which maps large files and decodes them
+    # with the same newline handling and errors as the text mode line scan
+    matches = []
+    size = len(content)
+    pos = 0
+    line = 1
+    while pos <= size:
+        start = content.find(search_pattern, pos)
+        if start == -1:
+            break
+        if start == size and content.endswith("\n"):
+            # empty match after the trailing newline, not a real line
+            break
+        line_start = content.rfind("\n", 0, start) + 1
+        line += content.count("\n", pos, line_start)
+        matches.append(line)
+        line_end = content.find("\n", start)
+        if line_end == -1:
+            break
+        pos = line_end + 1
+        line += 1
+    return matches
+
+
+def search_file(path, search_pattern) -> Tuple[str, Optional[Dict[str, Any]]]:
+    try:
+        if not _is_literal(search_pattern):
+            pattern = _compile(search_pattern)
+            # _load_file maps large files and decodes them like text mode does
+            lines = io.StringIO(_load_file(path))
+            matches = [i for i, line in enumerate(lines, 1) if pattern.search(line)]
+        elif os.stat(path).st_size >= _MMAP_THRESHOLD:
+            matches = _search_literal(_load_file(path), search_pattern)
+        else:
+            with open(path, "r") as f:
+                matches = [i for i, line in enumerate(f, 1) if search_pattern in line]
+        return (f"Matches found at lines: {matches}", None)
+    except (OSError, ValueError, re.error) as e:
+        return (f"Error searching file: {str(e)}", None)
+
+
 def list_files(path=".") -> Tuple[str, Optional[Dict[str, Any]]]:
     try:
-        files = os.listdir(path)
+        with os.scandir(path) as it:
+            files = [e.name + ("/" if e.is_dir(follow_symlinks=False) else "") for e in it]
         return ("\n".join(files), None)
-    except Exception as e:
+    except OSError as e:
         return (f"Error listing files: {str(e)}", None)
 
 
+@functools.lru_cache(maxsize=None)
+def _resolve_binary(name):
+    return shutil.which(name) or name
+
+
 def call_binary(path, args) -> str:
     try:
-        cmdline = [path, *args]
+        cmdline = [_resolve_binary(path), *args]
         print(f"running {cmdline}")
-        output = subprocess.check_output(cmdline)
-        return output.decode("utf-8")
+        result = subprocess.run(
+            cmdline,
+            capture_output=True,
+            encoding="utf-8",
+            check=True,
+            start_new_session=True,
+        )
+        return result.stdout
     except subprocess.CalledProcessError as e:
-        return f"Error: {e}"
+        return f"Error: {e}\n{e.stderr}"
 
 
 def create_workspace(path=".") -> Tuple[str, Optional[Dict[str, Any]]]:
@@ -271,12 +464,25 @@ def create_workspace(path=".") -> Tuple[str, Optional[Dict[str, Any]]]:
     return (out, None)
 
 
+try:
+    _YAML_LOADER = yaml.CSafeLoader
+except AttributeError:
+    # PyYAML built without libyaml
+    _YAML_LOADER = yaml.SafeLoader
+
+
+@functools.lru_cache(maxsize=64)
+def _load_openapi_paths(file_path, _mtime_ns, _size):
+    # mtime and size are part of the cache key so edited schemas get reparsed
+    with open(file_path, "r") as file:
+        data = yaml.load(file, Loader=_YAML_LOADER)
+        return tuple(data.get("paths", []))
+
+
 def get_openapi_paths(file_path):
     try:
-        with open(file_path, "r") as file:
-            data = yaml.safe_load(file)
-            paths = data.get("paths", [])
-            return paths
+        st = os.stat(file_path)
+        return _load_openapi_paths(file_path, st.st_mtime_ns, st.st_size)
     except FileNotFoundError:
         raise FileNotFoundError(f"File not found: {file_path}")
     except yaml.YAMLError as e:
@@ -285,7 +491,7 @@ def get_openapi_paths(file_path):
 
 def build_service_metadata(name, path):
     schema = path + f"/schemas/{name}/api/api.yaml"
-    metadata = {
+    meta = {
         name: [
             {
                 "record_type": "openapi_schema",
@@ -296,13 +502,15 @@ def build_service_metadata(name, path):
 
     paths = get_openapi_paths(schema)
     for p in paths:
-        metadata[name].append(
+        meta[name].append(
             {
                 "record_type": "api_handler",
                 "data": f"{path}/py-services/{name}/handlers{p}/service.py:{p}",
             }
         )
-    return metadata
+    return meta
+
+_background = ThreadPoolExecutor(max_workers=2)
 
 def create_service(name, language, path=".") -> Tuple[str, Optional[Dict[str, Any]]]:
     # python needs underscores in packages
@@ -314,54 +522,42 @@ def create_service(name, language, path=".") -> Tuple[str, Optional[Dict[str, An
 
 def mify_generate(name, path=".")  -> Tuple[str, Optional[Dict[str, Any]]]:
     name = name.replace('-', '_')
+    # generate only reads the schema, so it can be parsed while mify runs
+    meta = _background.submit(build_service_metadata, name, path)
     out = call_binary(
         "mify", ["generate", "-p", path]
     )
-    return (out, build_service_metadata(name, path))
+    return (out, meta.result())
 
 def add_client(name, client_name, path=".") -> Tuple[str, Optional[Dict[str, Any]]]:
     name = name.replace('-', '_')
     out = call_binary("mify", ["add", "client", name, "--to", client_name, "-p", path])
     return (out, None)
 
+_DISPATCH = {
+    "create_folder": lambda i: create_folder(i["path"]),
+    "create_file": lambda i: create_file(i["path"], i.get("content", "")),
+    "edit_file": lambda i: edit_file(i["path"], i["new_content"]),
+    "read_file": lambda i: read_file(i["path"]),
+    "search_file": lambda i: search_file(i["path"], i["search_pattern"]),
+    "list_files": lambda i: list_files(i.get("path", ".")),
+    "create_workspace": lambda i: create_workspace(i.get("path", ".")),
+    "create_service": lambda i: create_service(
+        i["name"], i["language"], i.get("path", ".")
+    ),
+    "add_client": lambda i: add_client(
+        i["name"], i["client_name"], i.get("path", ".")
+    ),
+    "mify_generate": lambda i: mify_generate(i["name"], i.get("path", ".")),
+}
+
+
 def execute_tool(tool_name, tool_input) -> Tuple[str, Optional[Dict[str, Any]]]:
     try:
-        if tool_name == "create_folder":
-            print(f"create_folder {tool_input['path']}")
-            return create_folder(tool_input["path"])
-        elif tool_name == "create_file":
-            print(f"create_file {tool_input['path']}")
-            return create_file(tool_input["path"], tool_input.get("content", ""))
-        elif tool_name == "edit_file":
-            print(f"edit_file {tool_input['path']}")
-            return edit_file(
-                tool_input["path"],
-                tool_input["new_content"],
-            )
-        elif tool_name == "read_file":
-            print(f"read_file {tool_input['path']}")
-            return read_file(tool_input["path"])
-        elif tool_name == "list_files":
-            print(f"list_files {tool_input['path']}")
-            return list_files(tool_input.get("path", "."))
-        elif tool_name == "create_workspace":
-            return create_workspace(tool_input.get("path", "."))
-        elif tool_name == "create_service":
-            return create_service(
-                tool_input["name"], tool_input["language"], tool_input.get("path", ".")
-            )
-        elif tool_name == "add_client":
-            return add_client(
-                tool_input["name"],
-                tool_input["client_name"],
-                tool_input.get("path", "."),
-            )
-        elif tool_name == "mify_generate":
-            return mify_generate(
-                tool_input["name"], tool_input.get("path", ".")
-            )
-        else:
+        handler = _DISPATCH.get(tool_name)
+        if handler is None:
             return (f"Unknown tool: {tool_name}", None)
+        return handler(tool_input)
     except KeyError as e:
         return (
             f"Error: Missing required parameter {str(e)} for tool {tool_name}",
@@ -369,3 +565,48 @@ def execute_tool(tool_name, tool_input) -> Tuple[str, Optional[Dict[str, Any]]]:
         )
     except Exception as e:
         return (f"Error executing tool {tool_name}: {str(e)}", None)
+
+
+def _create_folders(paths) -> List[Tuple[str, Optional[Dict[str, Any]]]]:
+    # makedirs on the deepest paths creates every parent along the way, so
+    # folders that are ancestors of another one in the run need no call
+    normalized = [os.path.normpath(p) for p in paths]
+    ancestors = set()
+    for n in normalized:
+        parent = os.path.dirname(n)
+        while parent and parent not in ancestors:
+            ancestors.add(parent)
+            parent = os.path.dirname(parent)
+
+    results = [None] * len(paths)
+    for i, n in enumerate(normalized):
+        if n not in ancestors:
+            results[i] = create_folder(paths[i])
+    for i, n in enumerate(normalized):
+        if results[i] is None:
+            if os.path.isdir(n):
+                results[i] = (f"Folder created: {paths[i]}", None)
+            else:
+                results[i] = create_folder(paths[i])
+    return results
+
+
+def execute_tools_batch(calls) -> List[Tuple[str, Optional[Dict[str, Any]]]]:
+    # runs {"name", "input"} calls in order and returns one result per call
+    results = []
+    i = 0
+    while i < len(calls):
+        j = i
+        while (
+            j < len(calls)
+            and calls[j]["name"] == "create_folder"
+            and "path" in calls[j]["input"]
+        ):
+            j += 1
+        if j - i > 1:
+            results.extend(_create_folders([c["input"]["path"] for c in calls[i:j]]))
+            i = j
+            continue
+        results.append(execute_tool(calls[i]["name"], calls[i]["input"]))
+        i += 1
+    return results
@@ -0,0 +1,79 @@
+"""normalize services
+
+Revision ID: a093cb75c5dc
+Revises: e062527bf2d4
+Create Date: 2026-10-15 11:04:27.190455
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a093cb75c5dc'
+down_revision: Union[str, None] = 'e062527bf2d4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('services',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('project_id', sa.Integer(), nullable=True),
+    sa.Column('name', sa.String(), nullable=True),
+    sa.ForeignKeyConstraint(['project_id'], ['projects.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('project_id', 'name')
+    )
+    op.create_index(op.f('ix_services_project_id'), 'services', ['project_id'], unique=False)
+
+    with op.batch_alter_table('project_context_records') as batch_op:
+        batch_op.add_column(sa.Column('service_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('record_type_code', sa.SmallInteger(), nullable=True))
+
+    # records created before service names were tracked are kept under ''
+    op.execute(
+        "INSERT INTO services (project_id, name) "
+        "SELECT DISTINCT project_id, COALESCE(service_name, '') FROM project_context_records"
+    )
+    op.execute(
+        "UPDATE project_context_records SET "
+        "service_id = (SELECT services.id FROM services "
+        "WHERE services.project_id = project_context_records.project_id "
+        "AND services.name = COALESCE(project_context_records.service_name, '')), "
+        "record_type_code = CASE record_type "
+        "WHEN 'FILE' THEN 0 WHEN 'OPENAPI_SCHEMA' THEN 1 WHEN 'API_HANDLER' THEN 2 END"
+    )
+
+    with op.batch_alter_table('project_context_records') as batch_op:
+        batch_op.drop_column('service_name')
+        batch_op.drop_column('record_type')
+        batch_op.alter_column('record_type_code', new_column_name='record_type')
+        batch_op.create_index(op.f('ix_project_context_records_service_id'), ['service_id'], unique=False)
+        batch_op.create_foreign_key('fk_project_context_records_service_id', 'services', ['service_id'], ['id'])
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('project_context_records') as batch_op:
+        batch_op.add_column(sa.Column('service_name', sa.String(), nullable=True))
+        batch_op.add_column(sa.Column('record_type_name', sa.Enum('FILE', 'OPENAPI_SCHEMA', 'API_HANDLER', name='recordtype'), nullable=True))
+
+    op.execute(
+        "UPDATE project_context_records SET "
+        "service_name = (SELECT services.name FROM services "
+        "WHERE services.id = project_context_records.service_id), "
+        "record_type_name = CASE record_type "
+        "WHEN 0 THEN 'FILE' WHEN 1 THEN 'OPENAPI_SCHEMA' WHEN 2 THEN 'API_HANDLER' END"
+    )
+
+    with op.batch_alter_table('project_context_records') as batch_op:
+        batch_op.drop_constraint('fk_project_context_records_service_id', type_='foreignkey')
+        batch_op.drop_index(op.f('ix_project_context_records_service_id'))
+        batch_op.drop_column('service_id')
+        batch_op.drop_column('record_type')
+        batch_op.alter_column('record_type_name', new_column_name='record_type')
+
+    op.drop_index(op.f('ix_services_project_id'), table_name='services')
+    op.drop_table('services')